@@ -1,3 +1,6 @@
+import time
+BOOT_START = time.perf_counter()  # 用于统计启动耗时，需在其他 import 之前
+
 import os
 import subprocess
 import json
@@ -6,10 +9,11 @@ import threading
 import zipfile
 import sys
 import uuid
+import hashlib
 import datetime
 import re
-import requests
-from openai import OpenAI
+import bisect
+# requests / openai 较重，改为在首次使用时再导入，加快容器启动
 from functools import wraps
 # 新增 quote 用于编码路径
 from urllib.parse import unquote, unquote_plus, quote
@@ -28,6 +32,12 @@ DEEPSEEK_BASE_URL = "https://api.deepseek.com"
 
 BASE_DIR = "/data"
 CONFIG_FILE = os.path.join(BASE_DIR, '.tracker_config.json')
+THUMB_DIR = os.path.join(BASE_DIR, '.thumb_cache')
+THUMB_CACHE_MAX = int(os.environ.get('THUMB_CACHE_MB', '512')) * 1024 * 1024
+THUMB_WIDTH = 320
+THUMB_TIMEOUT = 20  # 单次 ffprobe/ffmpeg 的超时秒数，损坏的文件不能长期占住线程池
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif')
+VIDEO_EXTS = ('.mkv', '.mp4', '.avi', '.ts', '.m2ts', '.mov', '.wmv', '.webm')
 
 app.secret_key = SECRET_KEY
 task_store = {} # 存储所有任务（做种 + 翻译）的状态和日志
@@ -55,20 +65,30 @@ def get_safe_path(rel_path):
     if not abs_target.startswith(abs_base): raise ValueError("非法路径访问")
     return abs_target
 
+tracker_config_cache = None  # 内存缓存，save_default_tracker 时直接更新
+tracker_config_lock = threading.Lock()
+
 def load_default_tracker():
-    default_url = "http://udp.opentrackr.org:1337/announce"
-    try:
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r') as f:
-                data = json.load(f)
-                return data.get('tracker_url', default_url)
-    except Exception: pass
-    return default_url
+    global tracker_config_cache
+    with tracker_config_lock:
+        if tracker_config_cache is not None: return tracker_config_cache
+        url = "http://udp.opentrackr.org:1337/announce"
+        try:
+            if os.path.exists(CONFIG_FILE):
+                with open(CONFIG_FILE, 'r') as f:
+                    data = json.load(f)
+                    url = data.get('tracker_url', url)
+        except Exception: pass
+        tracker_config_cache = url
+        return url
 
 def save_default_tracker(url):
-    try:
-        with open(CONFIG_FILE, 'w') as f: json.dump({'tracker_url': url}, f)
-    except Exception: pass
+    global tracker_config_cache
+    with tracker_config_lock:
+        try:
+            with open(CONFIG_FILE, 'w') as f: json.dump({'tracker_url': url}, f)
+        except Exception: pass
+        tracker_config_cache = url
 
 def find_largest_file(start_path):
     if os.path.isfile(start_path): return start_path
@@ -84,14 +104,28 @@ def find_largest_file(start_path):
             except OSError: continue
     return largest_file
 
-def get_video_duration(video_path):
+def get_video_duration(video_path, timeout=None):
     try:
         cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", video_path]
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
         val = result.stdout.strip()
         return float(val) if val else 0
     except: return 0
 
+openai_client = None
+openai_client_key = None
+openai_client_lock = threading.Lock()
+
+def get_openai_client():
+    """进程内复用同一个 OpenAI 客户端（连接池），API Key 变化时才重建"""
+    global openai_client, openai_client_key
+    with openai_client_lock:
+        if openai_client is None or openai_client_key != DEEPSEEK_API_KEY:
+            from openai import OpenAI
+            openai_client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL)
+            openai_client_key = DEEPSEEK_API_KEY
+        return openai_client
+
 # === 翻译逻辑 (多线程并发优化版) ===
 def background_translate(task_id, file_path):
     log_task(task_id, f"开始处理文件: {os.path.basename(file_path)}")
@@ -101,7 +135,7 @@ def background_translate(task_id, file_path):
         task_store[task_id]['status'] = 'error'
         return
 
-    client = OpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_BASE_URL)
+    client = get_openai_client()
     filename = os.path.basename(file_path)
     is_srt = filename.lower().endswith('.srt')
     
@@ -239,6 +273,7 @@ def background_translate(task_id, file_path):
         task_store[task_id]['status'] = 'error'
 
 def upload_to_pixhost(file_path):
+    import requests
     upload_url = "https://api.pixhost.to/images"
     try:
         with open(file_path, 'rb') as f:
@@ -262,7 +297,82 @@ def upload_to_pixhost(file_path):
         print(f"Upload exception for {file_path}: {e}")
     return None
 
-def generate_screenshots(video_path, output_base_path, mode, quality):
+# === 智能选帧：低分辨率关键帧采样 + 打分，避开黑屏/重复画面 ===
+SCENE_SAMPLE_W, SCENE_SAMPLE_H = 64, 32  # 采样帧尺寸 (8x8 块均值即为 aHash)
+SCENE_CANDIDATES_PER_SLOT = 3
+SCENE_RANGE = (0.03, 0.92)  # 跳过片头和片尾字幕
+SCENE_MIN_SCORE = 0.1  # 低于此分数说明是黑场/平坦/重复画面 (均被扣 2 分)
+
+def grab_keyframe_gray(video_path, timestamp):
+    """只解码 timestamp 之后的第一个关键帧，输出灰度小图的原始字节"""
+    cmd = ["ffmpeg", "-v", "error", "-ss", str(timestamp), "-skip_frame", "nokey", "-i", video_path,
+           "-frames:v", "1", "-vf", f"scale={SCENE_SAMPLE_W}:{SCENE_SAMPLE_H},format=gray", "-f", "rawvideo", "-"]
+    try: data = subprocess.run(cmd, capture_output=True, timeout=60).stdout
+    except subprocess.TimeoutExpired: return None
+    return data if len(data) == SCENE_SAMPLE_W * SCENE_SAMPLE_H else None
+
+def skip_scene_selection(task_id, reason):
+    """智能选帧不可用时记录原因并返回 None，调用方改用均匀间隔"""
+    log_task(task_id, f"⚠️ 智能选帧未启用，改用均匀间隔: {reason}")
+    if task_id in task_store: task_store[task_id]['shot_note'] = reason
+    return None
+
+def pick_scene_timestamps(video_path, duration, count, task_id=None):
+    """在每个时间段内采样若干候选关键帧，按 亮度/方差/与已选帧的感知哈希距离 打分挑选。失败返回 None"""
+    try: import numpy as np
+    except ImportError: return skip_scene_selection(task_id, "未安装 numpy")
+
+    start, end = duration * SCENE_RANGE[0], duration * SCENE_RANGE[1]
+    total = count * SCENE_CANDIDATES_PER_SLOT
+    step = (end - start) / total
+    timestamps = [start + step * (i + 0.5) for i in range(total)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        raw = list(executor.map(lambda t: grab_keyframe_gray(video_path, t), timestamps))
+    valid_count = sum(r is not None for r in raw)
+    if valid_count < count:
+        return skip_scene_selection(task_id, f"仅成功采样 {valid_count}/{total} 个候选帧，少于所需的 {count} 张")
+
+    blank = bytes(SCENE_SAMPLE_W * SCENE_SAMPLE_H)
+    valid = np.array([r is not None for r in raw])
+    frames = np.stack([np.frombuffer(r or blank, dtype=np.uint8) for r in raw]).astype(np.float32)
+    frames = frames.reshape(total, SCENE_SAMPLE_H, SCENE_SAMPLE_W)
+
+    luma = frames.mean(axis=(1, 2))
+    contrast = frames.std(axis=(1, 2))
+    blocks = frames.reshape(total, 8, SCENE_SAMPLE_H // 8, 8, SCENE_SAMPLE_W // 8).mean(axis=(2, 4)).reshape(total, 64)
+    hashes = blocks > blocks.mean(axis=1, keepdims=True)
+    distance = (hashes[:, None, :] != hashes[None, :, :]).sum(axis=2)  # 两两汉明距离 (0-64)
+
+    # 基础分：对比度越高越好；过暗/过曝/平坦画面（黑场、淡入淡出、纯色）重罚
+    base = np.minimum(contrast, 64) / 64
+    base -= 2.0 * ((luma < 25) | (luma > 230) | (contrast < 10))
+    base[~valid] = -100
+
+    def _score(idx):
+        score = base[idx].copy()
+        if chosen:
+            min_dist = distance[np.ix_(idx, chosen)].min(axis=1)
+            score += min_dist / 64 - 2.0 * (min_dist < 6)  # 与已选帧几乎一样则重罚
+        return score
+
+    chosen = []
+    slot_of = np.arange(total) // SCENE_CANDIDATES_PER_SLOT
+    for slot in range(count):
+        # 本时间段内没有合格画面时，逐步向相邻时间段借候选帧，实在没有才接受最好的那张
+        best, best_score = None, None
+        for radius in range(count):
+            mask = (np.abs(slot_of - slot) <= radius)
+            mask[chosen] = False
+            idx = np.flatnonzero(mask)
+            if len(idx) == 0: continue
+            score = _score(idx)
+            k = int(score.argmax())
+            if best_score is None or score[k] > best_score: best, best_score = idx[k], score[k]
+            if best_score > SCENE_MIN_SCORE: break
+        chosen.append(best)
+    return sorted(timestamps[i] for i in chosen)
+
+def generate_screenshots(video_path, output_base_path, mode, quality, select='even', task_id=None):
     temp_dir = "/tmp/temp_thumbs_processing"
     settings_grid = {'small': (320, 15), 'medium': (640, 5), 'large': (1280, 2)}
     settings_full = {'medium': (1920, 1, ["-qmin", "1", "-qmax", "1"]), 'large': (0, 1, ["-qmin", "1", "-qmax", "1"])}
@@ -281,13 +391,20 @@ def generate_screenshots(video_path, output_base_path, mode, quality):
             output_jpg = output_base_path + "_Thumb.jpg"
             blank_img = os.path.join(temp_dir, "blank.jpg")
             subprocess.run(["ffmpeg", "-f", "lavfi", "-i", f"color=c=black:s={width}x{int(width*9/16)}", "-frames:v", "1", "-y", blank_img], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            interval = duration / 16
-            for i in range(16):
-                timestamp = (i * interval) + (interval / 2)
+            timestamps = pick_scene_timestamps(video_path, duration, 16, task_id) if select == 'smart' else None
+            seek_flags = ["-skip_frame", "nokey"] if timestamps else []  # 智能模式下精确取回打分时的关键帧
+            if not timestamps:
+                interval = duration / 16
+                timestamps = [(i * interval) + (interval / 2) for i in range(16)]
+
+            def _grab(i):
                 img_path = os.path.join(temp_dir, f"img_{i:02d}.jpg")
-                cmd = ["ffmpeg", "-ss", str(timestamp), "-y", "-i", video_path, "-frames:v", "1", "-qscale:v", str(q_val), "-vf", f"scale={width}:-1", img_path]
+                cmd = ["ffmpeg", "-ss", str(timestamps[i])] + seek_flags + ["-y", "-i", video_path, "-frames:v", "1", "-qscale:v", str(q_val), "-vf", f"scale={width}:-1", img_path]
                 subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
                 if not os.path.exists(img_path) or os.path.getsize(img_path) == 0: shutil.copy(blank_img, img_path)
+
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(_grab, range(16)))
             cmd_tile = ["ffmpeg", "-y", "-i", os.path.join(temp_dir, "img_%02d.jpg"), "-vf", "tile=4x4:padding=5:color=white", "-qscale:v", str(q_val), output_jpg]
             subprocess.run(cmd_tile, capture_output=True)
             if os.path.exists(output_jpg): 
@@ -298,10 +415,13 @@ def generate_screenshots(video_path, output_base_path, mode, quality):
             target_width, q_val, extra_flags = settings_full.get(quality, (1920, 1, []))
             image_list = []
             steps = 7
+            timestamps = pick_scene_timestamps(video_path, duration, steps - 1, task_id) if select == 'smart' else None
+            seek_flags = ["-skip_frame", "nokey"] if timestamps else []
+            if not timestamps: timestamps = [duration * (i / steps) for i in range(1, steps)]
             for i in range(1, steps):
-                timestamp = duration * (i / steps)
+                timestamp = timestamps[i - 1]
                 img_path = f"{output_base_path}_shot_{i}.jpg"
-                cmd = ["ffmpeg", "-ss", str(timestamp), "-y", "-i", video_path, "-frames:v", "1", "-qscale:v", str(q_val)]
+                cmd = ["ffmpeg", "-ss", str(timestamp)] + seek_flags + ["-y", "-i", video_path, "-frames:v", "1", "-qscale:v", str(q_val)]
                 cmd.extend(extra_flags)
                 if target_width > 0: cmd.extend(["-vf", f"scale={target_width}:-1"])
                 cmd.append(img_path)
@@ -322,7 +442,7 @@ def generate_screenshots(video_path, output_base_path, mode, quality):
     finally:
         if os.path.exists(temp_dir): shutil.rmtree(temp_dir)
 
-def background_process(tracker_url, is_private, comment, piece_size, full_source_path, output_folder, task_id, shot_mode, shot_quality):
+def background_process(tracker_url, is_private, comment, piece_size, full_source_path, output_folder, task_id, shot_mode, shot_quality, shot_select='even'):
     log_task(task_id, f"启动做种任务...")
     task_store[task_id] = {'status': 'running', 'msg': '初始化...', 'files': {}, 'bbcode': ''}
     try:
@@ -359,7 +479,7 @@ def background_process(tracker_url, is_private, comment, piece_size, full_source
             if os.path.exists(f_info): task_store[task_id]['files']['info'] = f_info
             
             task_store[task_id]['msg'] = f'正在截图 ({shot_mode}/{shot_quality})...'
-            status, res = generate_screenshots(target_media_file, f_shot_base, shot_mode, shot_quality)
+            status, res = generate_screenshots(target_media_file, f_shot_base, shot_mode, shot_quality, shot_select, task_id)
             if status == "success":
                  if res.get('file'): task_store[task_id]['files']['shot_download'] = res['file']
                  if res.get('preview'): task_store[task_id]['files']['shot_preview'] = res['preview']
@@ -375,6 +495,8 @@ def background_process(tracker_url, is_private, comment, piece_size, full_source
                      task_store[task_id]['bbcode'] = "\n".join(bbcode_lines)
 
                  task_store[task_id]['msg'] = '✅ 全部成功'
+                 if task_store[task_id].get('shot_note'):
+                     task_store[task_id]['msg'] += f" (智能选帧未启用: {task_store[task_id]['shot_note']})"
             else: task_store[task_id]['msg'] = f"⚠️ 截图失败: {res}"
         else: task_store[task_id]['msg'] = '✅ 完成 (无视频)'
         task_store[task_id]['status'] = 'done'
@@ -449,9 +571,547 @@ def extract_audio_streams(video_path):
                 count += 1
                 
         return True, f"成功提取 {count} 条音轨"
-    except Exception as e: 
+    except Exception as e:
         return False, str(e)
-        
+
+# === 批量移动/删除 (后台任务 + 进度 + 可取消) ===
+COPY_CHUNK_SIZE = 64 * 1024 * 1024  # 跨盘复制时每个分块的大小
+COPY_WORKERS = 4  # 跨盘复制的并发线程数
+VERIFY_BLOCK_SIZE = 4 * 1024 * 1024  # 复制后逐块比对时每次读取的大小
+
+class TaskCancelled(Exception):
+    pass
+
+def check_cancel(task_id):
+    if task_store.get(task_id, {}).get('cancel'): raise TaskCancelled()
+
+def add_progress(task_id, lock, amount):
+    """累加进度并计算吞吐量"""
+    with lock:
+        prog = task_store[task_id]['progress']
+        prog['done'] += amount
+        elapsed = time.time() - prog['start']
+        prog['speed'] = prog['done'] / elapsed if elapsed > 0 else 0
+
+def copy_range(task_id, lock, abort, src, dst, start, length):
+    """复制文件的一个区间：优先 copy_file_range，其次 sendfile，最后 pread/pwrite；复制完立即逐块比对"""
+    in_fd = os.open(src, os.O_RDONLY)
+    out_fd = os.open(dst, os.O_RDWR)
+    try:
+        offset = start; end = start + length
+        use_cfr = hasattr(os, 'copy_file_range'); use_sendfile = hasattr(os, 'sendfile')
+        while offset < end:
+            check_cancel(task_id)
+            if abort.is_set(): raise TaskCancelled()
+            count = end - offset
+            n = 0
+            if use_cfr:
+                try: n = os.copy_file_range(in_fd, out_fd, count, offset, offset)
+                except OSError: use_cfr = False
+            if n == 0 and use_sendfile:
+                try:
+                    os.lseek(out_fd, offset, os.SEEK_SET)
+                    n = os.sendfile(out_fd, in_fd, offset, count)
+                except OSError: use_sendfile = False
+            if n == 0:
+                buf = os.pread(in_fd, min(count, COPY_CHUNK_SIZE), offset)
+                if not buf: raise IOError(f"源文件意外截断: {src}")
+                n = os.pwrite(out_fd, buf, offset)
+            offset += n
+            add_progress(task_id, lock, n)
+        # 先落盘，再丢弃页缓存，确保比对读到的是目标设备上的真实数据
+        os.fsync(out_fd)
+        if hasattr(os, 'posix_fadvise'): os.posix_fadvise(out_fd, start, length, os.POSIX_FADV_DONTNEED)
+        verify_range(task_id, abort, in_fd, out_fd, src, start, length)
+    finally:
+        os.close(in_fd); os.close(out_fd)
+
+def verify_range(task_id, abort, in_fd, out_fd, src, start, length):
+    """逐块比对源文件与副本的同一区间，任何不一致都视为复制失败"""
+    offset = start; end = start + length
+    while offset < end:
+        check_cancel(task_id)
+        if abort.is_set(): raise TaskCancelled()
+        count = min(VERIFY_BLOCK_SIZE, end - offset)
+        if os.pread(in_fd, count, offset) != os.pread(out_fd, count, offset):
+            raise IOError(f"校验失败: {src} (偏移 {offset})")
+        offset += count
+
+def fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try: os.fsync(fd)
+    finally: os.close(fd)
+
+def copy_tree_parallel(task_id, lock, src, dst):
+    """跨盘复制文件或文件夹：先建目录结构，再把所有文件切块并发复制、逐块比对"""
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)  # 与 shutil.move 一致：链接本身照搬，不复制其指向的内容
+        fsync_dir(os.path.dirname(dst))
+        return
+    file_pairs = []; dir_pairs = []
+    if os.path.isdir(src):
+        for root, dirs, files in os.walk(src):
+            target_root = os.path.join(dst, os.path.relpath(root, src))
+            os.makedirs(target_root, exist_ok=True)
+            dir_pairs.append((root, target_root))
+            for d in dirs:
+                s = os.path.join(root, d)
+                if os.path.islink(s): os.symlink(os.readlink(s), os.path.join(target_root, d))
+            for f in files:
+                s = os.path.join(root, f); t = os.path.join(target_root, f)
+                if os.path.islink(s): os.symlink(os.readlink(s), t)
+                else: file_pairs.append((s, t))
+    else:
+        file_pairs.append((src, dst))
+
+    jobs = []
+    for s, t in file_pairs:
+        size = os.path.getsize(s)
+        with open(t, 'wb') as f: f.truncate(size)  # 预分配，便于多个分块并发写入
+        for start in range(0, size, COPY_CHUNK_SIZE):
+            jobs.append((s, t, start, min(COPY_CHUNK_SIZE, size - start)))
+
+    abort = threading.Event()
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+        futures = [executor.submit(copy_range, task_id, lock, abort, *job) for job in jobs]
+        try:
+            for future in as_completed(futures): future.result()
+        except BaseException:
+            abort.set()  # 让其余分块尽快退出
+            raise
+
+    for s, t in file_pairs:
+        if os.path.getsize(t) != os.path.getsize(s): raise IOError(f"校验失败: {s}")
+        shutil.copystat(s, t)
+    # 自底向上恢复目录的权限和修改时间，避免被后续写入覆盖
+    for s, t in reversed(dir_pairs): shutil.copystat(s, t)
+    # 目录项也要落盘，之后才能删除源文件
+    for s, t in dir_pairs: fsync_dir(t)
+    fsync_dir(os.path.dirname(dst))
+
+def get_total_size(path):
+    if os.path.islink(path): return 0
+    if not os.path.isdir(path): return os.path.getsize(path)
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            fp = os.path.join(root, f)
+            if not os.path.islink(fp): total += os.path.getsize(fp)
+    return total
+
+def background_batch_move(task_id, sources, dest_full):
+    lock = threading.Lock()
+    success_count = 0
+    try:
+        dest_dev = os.stat(dest_full).st_dev
+        cross_items = []
+        for src in sources:
+            check_cancel(task_id)
+            name = os.path.basename(src.rstrip('/'))
+            target = os.path.join(dest_full, name)
+            if src == dest_full: continue
+            if os.path.exists(target):
+                log_task(task_id, f"⚠️ 跳过 {name}: 目标已存在"); continue
+            try:
+                if os.lstat(src).st_dev == dest_dev:
+                    os.rename(src, target)  # 同一设备直接重命名，瞬间完成
+                    success_count += 1
+                    log_task(task_id, f"已移动 {name}")
+                else:
+                    cross_items.append((src, target))
+            except Exception as e: log_task(task_id, f"移动失败 {name}: {e}")
+
+        if cross_items:
+            task_store[task_id]['progress']['total'] = sum(get_total_size(s) for s, t in cross_items)
+            task_store[task_id]['progress']['start'] = time.time()
+            log_task(task_id, f"跨磁盘复制 {len(cross_items)} 个项目，共 {task_store[task_id]['progress']['total'] / 1024**3:.2f} GB...")
+            for src, target in cross_items:
+                name = os.path.basename(target)
+                try:
+                    copy_tree_parallel(task_id, lock, src, target)
+                except Exception as e:
+                    # 未完成的副本直接清理，源文件保持不动
+                    if os.path.isdir(target) and not os.path.islink(target): shutil.rmtree(target, ignore_errors=True)
+                    elif os.path.lexists(target): os.remove(target)
+                    if isinstance(e, TaskCancelled): raise
+                    log_task(task_id, f"移动失败 {name}: {e}")
+                    continue
+                if os.path.isdir(src) and not os.path.islink(src): shutil.rmtree(src)
+                else: os.remove(src)
+                success_count += 1
+                prog = task_store[task_id]['progress']
+                log_task(task_id, f"已移动 {name} ({prog['speed'] / 1024**2:.1f} MB/s)")
+
+        log_task(task_id, f"✅ 成功移动 {success_count} 个项目")
+        task_store[task_id]['status'] = 'done'
+    except TaskCancelled:
+        log_task(task_id, f"⏹️ 已取消，已完成 {success_count} 个项目")
+        task_store[task_id]['status'] = 'cancelled'
+    except Exception as e:
+        log_task(task_id, f"💀 移动失败: {str(e)}")
+        task_store[task_id]['status'] = 'error'
+
+def background_batch_delete(task_id, targets):
+    lock = threading.Lock()
+    try:
+        task_store[task_id]['progress']['total'] = sum(
+            sum(len(files) + len(dirs) for _, dirs, files in os.walk(t)) + 1 if os.path.isdir(t) else 1
+            for t in targets)
+        task_store[task_id]['progress']['start'] = time.time()
+        success_count = 0
+        for target in targets:
+            name = os.path.basename(target.rstrip('/'))
+            try:
+                if os.path.isdir(target) and not os.path.islink(target):
+                    # 自底向上逐个删除，便于汇报进度和随时取消
+                    for root, dirs, files in os.walk(target, topdown=False):
+                        for f in files:
+                            check_cancel(task_id)
+                            os.remove(os.path.join(root, f))
+                            add_progress(task_id, lock, 1)
+                        for d in dirs:
+                            dp = os.path.join(root, d)
+                            if os.path.islink(dp): os.remove(dp)
+                            else: os.rmdir(dp)
+                            add_progress(task_id, lock, 1)
+                    os.rmdir(target)
+                else:
+                    check_cancel(task_id)
+                    os.remove(target)
+            except TaskCancelled: raise
+            except Exception as e:
+                log_task(task_id, f"删除失败 {name}: {e}"); continue
+            add_progress(task_id, lock, 1)
+            success_count += 1
+            log_task(task_id, f"已删除 {name}")
+        log_task(task_id, f"✅ 成功删除 {success_count} 个项目")
+        task_store[task_id]['status'] = 'done'
+    except TaskCancelled:
+        log_task(task_id, "⏹️ 已取消删除")
+        task_store[task_id]['status'] = 'cancelled'
+    except Exception as e:
+        log_task(task_id, f"💀 删除失败: {str(e)}")
+        task_store[task_id]['status'] = 'error'
+
+def start_file_task(op_type, unit, target, args):
+    task_id = str(uuid.uuid4())[:8]
+    task_store[task_id] = {
+        'status': 'running',
+        'msg': '准备开始...',
+        'logs': [],
+        'type': op_type,
+        'cancel': False,
+        'progress': {'done': 0, 'total': 0, 'unit': unit, 'speed': 0, 'start': time.time()}
+    }
+    t = threading.Thread(target=target, args=(task_id,) + args)
+    t.start()
+    return task_id
+
+# === 缩略图缓存 (按 路径+大小+修改时间 寻址，LRU 淘汰) ===
+thumb_executor = ThreadPoolExecutor(max_workers=4)
+thumb_pending = {}  # cache_key -> Future，避免重复生成
+thumb_lock = threading.Lock()
+thumb_cache_bytes = None  # 缓存目录当前总大小，首次用到时统计
+
+def is_thumb_candidate(name):
+    return name.lower().endswith(IMAGE_EXTS + VIDEO_EXTS)
+
+def get_thumb_path(file_path):
+    st = os.stat(file_path)
+    key = hashlib.sha1(f"{file_path}|{st.st_size}|{st.st_mtime_ns}".encode('utf-8')).hexdigest()
+    return os.path.join(THUMB_DIR, key[:2], key + ".jpg")
+
+def evict_thumb_cache(added_bytes):
+    """记录新增大小，超出上限时按最近访问时间淘汰到上限的 90%"""
+    global thumb_cache_bytes
+    with thumb_lock:
+        if thumb_cache_bytes is None:
+            thumb_cache_bytes = 0
+            for root, dirs, files in os.walk(THUMB_DIR):
+                for f in files: thumb_cache_bytes += os.path.getsize(os.path.join(root, f))
+        else:
+            thumb_cache_bytes += added_bytes
+        if thumb_cache_bytes <= THUMB_CACHE_MAX: return
+        entries = []
+        for root, dirs, files in os.walk(THUMB_DIR):
+            for f in files:
+                fp = os.path.join(root, f)
+                try: st = os.stat(fp)
+                except OSError: continue
+                entries.append((st.st_mtime, st.st_size, fp))
+        entries.sort()
+        for mtime, size, fp in entries:
+            if thumb_cache_bytes <= THUMB_CACHE_MAX * 0.9: break
+            try: os.remove(fp); thumb_cache_bytes -= size
+            except OSError: pass
+
+def get_fail_marker(thumb_path):
+    return os.path.splitext(thumb_path)[0] + ".fail"
+
+def generate_thumbnail(file_path, thumb_path):
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    tmp_path = thumb_path + ".tmp.jpg"
+    cmd = ["ffmpeg", "-v", "error", "-y"]
+    if file_path.lower().endswith(VIDEO_EXTS):
+        # 取 10% 处的关键帧做封面，避开片头黑屏
+        duration = get_video_duration(file_path, timeout=THUMB_TIMEOUT)
+        cmd.extend(["-ss", str(duration * 0.1), "-skip_frame", "nokey"])
+    cmd.extend(["-i", file_path, "-frames:v", "1", "-vf", f"scale='min({THUMB_WIDTH},iw)':-2", "-qscale:v", "5", tmp_path])
+    timed_out = False
+    try: subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=THUMB_TIMEOUT)
+    except subprocess.TimeoutExpired: timed_out = True  # 超时产生的半截文件不可用，按失败处理
+    if timed_out or not os.path.exists(tmp_path) or os.path.getsize(tmp_path) == 0:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        # 记录失败（同一 路径+大小+修改时间 不再重试），文件变动后键值改变会自动重新生成
+        open(get_fail_marker(thumb_path), 'w').close()
+        return None
+    os.replace(tmp_path, thumb_path)
+    evict_thumb_cache(os.path.getsize(thumb_path))
+    return thumb_path
+
+def request_thumbnail(file_path):
+    """返回缩略图路径；已知无法生成时返回 None；未缓存时提交到后台线程池，返回对应的 Future"""
+    thumb_path = get_thumb_path(file_path)
+    if os.path.exists(thumb_path):
+        try: os.utime(thumb_path)  # 更新访问时间，供 LRU 使用
+        except OSError: pass
+        return thumb_path
+    if os.path.exists(get_fail_marker(thumb_path)): return None
+    with thumb_lock:
+        future = thumb_pending.get(thumb_path)
+        if future is None:
+            future = thumb_executor.submit(generate_thumbnail, file_path, thumb_path)
+            thumb_pending[thumb_path] = future
+            future.add_done_callback(lambda f: thumb_pending.pop(thumb_path, None))
+    return future
+
+# === 种子校验 / 辅种匹配 ===
+VERIFY_WORKERS = 8  # 并发校验线程数 (hashlib 计算时会释放 GIL)
+MATCH_MAX_DEPTH = 4  # 匹配时向下扫描的目录层数
+MATCH_SAMPLE_PIECES = 5  # 候选目录抽样校验的分块数
+
+def bdecode(data, pos=0):
+    """解析 bencode，返回 (值, 结束位置)；字典额外记录 info 的原始字节区间用于计算 infohash"""
+    c = data[pos:pos + 1]
+    if c == b'i':
+        end = data.index(b'e', pos)
+        return int(data[pos + 1:end]), end + 1
+    if c == b'l':
+        pos += 1; items = []
+        while data[pos:pos + 1] != b'e':
+            item, pos = bdecode(data, pos); items.append(item)
+        return items, pos + 1
+    if c == b'd':
+        pos += 1; result = {}
+        while data[pos:pos + 1] != b'e':
+            key, pos = bdecode(data, pos)
+            value_start = pos
+            result[key], pos = bdecode(data, pos)
+            if key == b'info': result[b'__info_span__'] = (value_start, pos)
+        return result, pos + 1
+    if c.isdigit():
+        colon = data.index(b':', pos)
+        length = int(data[pos:colon])
+        return data[colon + 1:colon + 1 + length], colon + 1 + length
+    raise ValueError(f"无效的种子文件 (位置 {pos})")
+
+def parse_torrent(torrent_path):
+    with open(torrent_path, 'rb') as f: raw = f.read()
+    meta, _ = bdecode(raw)
+    info = meta.get(b'info')
+    if not isinstance(info, dict): raise ValueError("种子缺少 info 字段")
+    if b'pieces' not in info: raise ValueError("暂不支持纯 v2 种子")
+    start, end = meta[b'__info_span__']
+
+    def _text(d, key):
+        value = d.get(key + b'.utf-8', d.get(key, b''))
+        return value.decode('utf-8', errors='replace')
+
+    def _component(part):
+        # 种子里的名称会拼进本地路径，必须是单一的普通路径段，防止跳出 /data
+        if isinstance(part, bytes): part = part.decode('utf-8', errors='replace')
+        if part in ('', '.', '..') or '/' in part or '\\' in part or '\0' in part:
+            raise ValueError(f"种子包含非法路径: {part!r}")
+        return part
+
+    name = _component(_text(info, b'name'))
+    files = []
+    if b'files' in info:
+        for item in info[b'files']:
+            parts = item.get(b'path.utf-8', item.get(b'path', []))
+            if not parts: raise ValueError("种子文件列表中存在空路径")
+            files.append({
+                'path': os.path.join(*[_component(p) for p in parts]),
+                'length': item[b'length'],
+                'pad': b'p' in item.get(b'attr', b''),  # BEP 47 填充文件，内容全为 0
+            })
+    else:
+        files.append({'path': '', 'length': info[b'length'], 'pad': False})
+    pieces = info[b'pieces']
+    return {
+        'name': name,
+        'infohash': hashlib.sha1(raw[start:end]).hexdigest(),
+        'multi': b'files' in info,
+        'piece_length': info[b'piece length'],
+        'pieces': [pieces[i:i + 20] for i in range(0, len(pieces), 20)],
+        'files': files,
+        'total': sum(f['length'] for f in files),
+    }
+
+def resolve_payload_root(meta, path):
+    """允许传入下载目录本身或其上一级目录"""
+    candidate = os.path.join(path, meta['name'])
+    if meta['multi']:
+        return candidate if os.path.isdir(candidate) else path
+    return candidate if os.path.isdir(path) else path
+
+def build_piece_reader(meta, root):
+    """返回 read_piece(index)：按全局偏移跨文件读取分块，文件缺失/过短时返回 None"""
+    spans = []; offset = 0
+    abs_base = os.path.abspath(BASE_DIR)
+    for f in meta['files']:
+        full = os.path.join(root, f['path']) if meta['multi'] else root
+        if not os.path.abspath(full).startswith(abs_base + os.sep): raise ValueError("非法路径访问")
+        spans.append((offset, f['length'], full, f['pad']))
+        offset += f['length']
+    starts = [s[0] for s in spans]
+    piece_length = meta['piece_length']; total = meta['total']
+
+    def read_piece(index):
+        begin = index * piece_length; end = min(begin + piece_length, total)
+        buf = bytearray()
+        i = bisect.bisect_right(starts, begin) - 1
+        while begin < end:
+            f_start, f_len, f_path, is_pad = spans[i]
+            chunk = min(end, f_start + f_len) - begin
+            if chunk > 0:
+                if is_pad: buf += bytes(chunk)
+                else:
+                    try:
+                        with open(f_path, 'rb') as fh:
+                            fh.seek(begin - f_start); data = fh.read(chunk)
+                    except OSError: return None
+                    if len(data) != chunk: return None
+                    buf += data
+                begin += chunk
+            i += 1
+        return bytes(buf)
+
+    def files_of_piece(index):
+        begin = index * piece_length; end = min(begin + piece_length, total)
+        i = bisect.bisect_right(starts, begin) - 1
+        names = []
+        while i < len(spans) and spans[i][0] < end:
+            if spans[i][1] > 0 and not spans[i][3]: names.append(meta['files'][i]['path'] or meta['name'])
+            i += 1
+        return names
+
+    return read_piece, files_of_piece
+
+def check_piece(meta, read_piece, index):
+    data = read_piece(index)
+    return data is not None and hashlib.sha1(data).digest() == meta['pieces'][index]
+
+def background_verify_torrent(task_id, torrent_path, content_path):
+    lock = threading.Lock()
+    try:
+        meta = parse_torrent(torrent_path)
+        root = resolve_payload_root(meta, content_path)
+        log_task(task_id, f"种子: {meta['name']} (infohash {meta['infohash']})")
+        log_task(task_id, f"数据位置: {root}，共 {len(meta['pieces'])} 个分块，{meta['total'] / 1024**3:.2f} GB")
+        task_store[task_id]['progress']['total'] = meta['total']
+        task_store[task_id]['progress']['start'] = time.time()
+        read_piece, files_of_piece = build_piece_reader(meta, root)
+
+        def _verify(index):
+            check_cancel(task_id)
+            ok = check_piece(meta, read_piece, index)
+            add_progress(task_id, lock, min(meta['piece_length'], meta['total'] - index * meta['piece_length']))
+            return index, ok
+
+        bad_pieces = []
+        with ThreadPoolExecutor(max_workers=VERIFY_WORKERS) as executor:
+            for index, ok in executor.map(_verify, range(len(meta['pieces']))):
+                if not ok: bad_pieces.append(index)
+
+        total_pieces = len(meta['pieces'])
+        if not bad_pieces:
+            log_task(task_id, f"✅ 校验通过: {total_pieces}/{total_pieces} 个分块完整")
+        else:
+            bad_files = sorted({name for i in bad_pieces for name in files_of_piece(i)})
+            log_task(task_id, f"⚠️ {len(bad_pieces)}/{total_pieces} 个分块校验失败 ({(1 - len(bad_pieces) / total_pieces) * 100:.2f}% 完整)")
+            for name in bad_files[:50]: log_task(task_id, f"  损坏或缺失: {name}")
+            if len(bad_files) > 50: log_task(task_id, f"  ... 另有 {len(bad_files) - 50} 个文件")
+        task_store[task_id]['result'] = {'bad_pieces': len(bad_pieces), 'total_pieces': total_pieces}
+        task_store[task_id]['status'] = 'done'
+    except TaskCancelled:
+        log_task(task_id, "⏹️ 已取消校验")
+        task_store[task_id]['status'] = 'cancelled'
+    except Exception as e:
+        log_task(task_id, f"💀 校验失败: {str(e)}")
+        task_store[task_id]['status'] = 'error'
+
+def find_match_candidates(task_id, meta, search_root):
+    """只用文件系统元数据（路径 + 大小）筛选候选位置，不读取文件内容"""
+    real_files = [f for f in meta['files'] if not f['pad']]
+    largest = max(real_files, key=lambda f: f['length'])
+    candidates = []
+    base_depth = search_root.rstrip(os.sep).count(os.sep)
+    for root, dirs, files in os.walk(search_root):
+        check_cancel(task_id)
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        if root.count(os.sep) - base_depth >= MATCH_MAX_DEPTH: dirs[:] = []
+        if meta['multi']:
+            # 先检查最大的文件，绝大多数目录一次 stat 就能排除
+            try:
+                if os.path.getsize(os.path.join(root, largest['path'])) != largest['length']: continue
+                if all(os.path.getsize(os.path.join(root, f['path'])) == f['length'] for f in real_files):
+                    candidates.append(root)
+            except OSError: continue
+        else:
+            for f in files:
+                full = os.path.join(root, f)
+                try:
+                    if os.path.getsize(full) == largest['length']: candidates.append(full)
+                except OSError: continue
+    # 名称一致的候选优先
+    candidates.sort(key=lambda p: os.path.basename(p) != meta['name'])
+    return candidates
+
+def background_match_torrent(task_id, torrent_path, search_root):
+    try:
+        meta = parse_torrent(torrent_path)
+        log_task(task_id, f"种子: {meta['name']} (infohash {meta['infohash']})")
+        t0 = time.time()
+        candidates = find_match_candidates(task_id, meta, search_root)
+        log_task(task_id, f"按文件名/大小筛选出 {len(candidates)} 个候选 ({time.time() - t0:.1f}s)")
+
+        total_pieces = len(meta['pieces'])
+        step = max(1, total_pieces // MATCH_SAMPLE_PIECES)
+        sample = sorted(set(list(range(0, total_pieces, step))[:MATCH_SAMPLE_PIECES] + [total_pieces - 1]))
+        task_store[task_id]['progress']['total'] = len(candidates)
+        matches = []
+        with ThreadPoolExecutor(max_workers=len(sample)) as executor:
+            for candidate in candidates:
+                check_cancel(task_id)
+                read_piece, _ = build_piece_reader(meta, candidate)
+                ok = all(executor.map(lambda i, rp=read_piece: check_piece(meta, rp, i), sample))
+                task_store[task_id]['progress']['done'] += 1
+                if ok:
+                    matches.append(os.path.relpath(candidate, BASE_DIR))
+                    log_task(task_id, f"✅ 匹配: {matches[-1]}")
+
+        if not matches: log_task(task_id, "未找到匹配的数据")
+        else: log_task(task_id, f"共找到 {len(matches)} 个匹配 (抽样校验 {len(sample)} 个分块)，用时 {time.time() - t0:.1f}s")
+        task_store[task_id]['result'] = {'matches': matches}
+        task_store[task_id]['status'] = 'done'
+    except TaskCancelled:
+        log_task(task_id, "⏹️ 已取消匹配")
+        task_store[task_id]['status'] = 'cancelled'
+    except Exception as e:
+        log_task(task_id, f"💀 匹配失败: {str(e)}")
+        task_store[task_id]['status'] = 'error'
+
 # ================= 路由 =================
 def login_required(f):
     @wraps(f)
@@ -498,12 +1158,16 @@ def list_files():
                 if item.startswith('.'): continue
                 item_path = os.path.join(full_path, item)
                 is_dir = os.path.isdir(item_path)
-                file_list.append({
+                entry = {
                     'name': item,
                     'type': 'dir' if is_dir else 'file',
                     'size': os.path.getsize(item_path) if not is_dir else 0,
                     'is_txt': item.lower().endswith(('.txt', '.nfo', '.md'))
-                })
+                }
+                if not is_dir and is_thumb_candidate(item):
+                    # 只返回地址，由前端懒加载的 <img> 按需触发生成，列表本身立即返回
+                    entry['thumb'] = url_for('thumbnail', path=os.path.join(current_rel, item), v=int(os.path.getmtime(item_path)))
+                file_list.append(entry)
         file_list.sort(key=lambda x: (x['type'] != 'dir', x['name']))
         return jsonify({'success': True, 'files': file_list, 'current_path': current_rel})
     except Exception as e: return jsonify({'success': False, 'msg': str(e)})
@@ -601,14 +1265,12 @@ def file_op():
         elif op_type == 'batch_delete':
             filenames = data.get('filenames', [])
             if not filenames: return jsonify({'success': False, 'msg': '未选择文件'})
+            targets = []
             for name in filenames:
-                try:
-                    full_target = get_safe_path(os.path.join(current_path, name))
-                    if os.path.exists(full_target):
-                        if os.path.isdir(full_target): shutil.rmtree(full_target)
-                        else: os.remove(full_target)
-                except Exception as e: print(f"删除失败 {name}: {e}")
-            return jsonify({'success': True})
+                full_target = get_safe_path(os.path.join(current_path, name))
+                if os.path.lexists(full_target): targets.append(full_target)
+            task_id = start_file_task('batch_delete', 'items', background_batch_delete, (targets,))
+            return jsonify({'success': True, 'task_id': task_id, 'msg': '删除任务已启动'})
         
         elif op_type == 'batch_move':
             filenames = data.get('filenames', [])
@@ -619,15 +1281,31 @@ def file_op():
             if not os.path.exists(dest_full) or not os.path.isdir(dest_full):
                  try: os.makedirs(dest_full, exist_ok=True)
                  except: return jsonify({'success': False, 'msg': '目标文件夹不存在且无法创建'})
-            success_count = 0
-            for name in filenames:
-                try:
-                    src_full = get_safe_path(os.path.join(current_path, name))
-                    if src_full == dest_full: continue 
-                    shutil.move(src_full, dest_full)
-                    success_count += 1
-                except Exception as e: print(f"移动失败 {name}: {e}")
-            return jsonify({'success': True, 'msg': f"成功移动 {success_count} 个项目"})
+            sources = [get_safe_path(os.path.join(current_path, name)) for name in filenames]
+            task_id = start_file_task('batch_move', 'bytes', background_batch_move, (sources, dest_full))
+            return jsonify({'success': True, 'task_id': task_id, 'msg': '移动任务已启动'})
+
+        elif op_type == 'verify_torrent':
+            torrent_full = get_safe_path(os.path.join(current_path, data.get('filename', '')))
+            content_full = get_safe_path(data.get('content_path', '').strip())
+            if not os.path.isfile(torrent_full): return jsonify({'success': False, 'msg': '种子文件不存在'})
+            if not os.path.exists(content_full): return jsonify({'success': False, 'msg': '数据路径不存在'})
+            task_id = start_file_task('verify_torrent', 'bytes', background_verify_torrent, (torrent_full, content_full))
+            return jsonify({'success': True, 'task_id': task_id, 'msg': '校验任务已启动'})
+
+        elif op_type == 'match_torrent':
+            torrent_full = get_safe_path(os.path.join(current_path, data.get('filename', '')))
+            search_full = get_safe_path(data.get('search_path', '').strip())
+            if not os.path.isfile(torrent_full): return jsonify({'success': False, 'msg': '种子文件不存在'})
+            if not os.path.isdir(search_full): return jsonify({'success': False, 'msg': '搜索目录不存在'})
+            task_id = start_file_task('match_torrent', 'items', background_match_torrent, (torrent_full, search_full))
+            return jsonify({'success': True, 'task_id': task_id, 'msg': '匹配任务已启动'})
+
+        elif op_type == 'cancel_task':
+            task_id = data.get('task_id')
+            if task_id not in task_store: return jsonify({'success': False, 'msg': '任务不存在'})
+            task_store[task_id]['cancel'] = True
+            return jsonify({'success': True, 'msg': '已请求取消'})
         
         return jsonify({'success': False, 'msg': '未知操作'})
     except Exception as e:
@@ -649,6 +1327,7 @@ def submit_task():
         piece_size = request.form.get('piece_size', '24')
         shot_mode = request.form.get('shot_mode', 'grid')
         shot_quality = request.form.get('shot_quality', 'medium')
+        shot_select = request.form.get('shot_select', 'even')
 
         if save_default and tracker_url: save_default_tracker(tracker_url)
         full_source_path = get_safe_path(rel_path)
@@ -662,7 +1341,7 @@ def submit_task():
         t = threading.Thread(target=background_process, args=(
             tracker_url, is_private, comment, piece_size, 
             full_source_path, output_folder, task_id,
-            shot_mode, shot_quality
+            shot_mode, shot_quality, shot_select
         ))
         t.start()
         return jsonify({'success': True, 'task_id': task_id})
@@ -676,12 +1355,13 @@ def index():
     task_id = request.args.get('task_id')
     
     download_link = None; mediainfo_link = None; shot_download_link = None; shot_preview_link = None  
-    mediainfo_content = ""; bbcode_content = ""; error_msg = None
+    mediainfo_content = ""; bbcode_content = ""; error_msg = None; shot_note = None
     
     if task_id and task_id in task_store:
         task_data = task_store[task_id]
         if task_data['status'] == 'done':
             if "失败" in task_data['msg']: error_msg = task_data['msg']
+            shot_note = task_data.get('shot_note')
             files = task_data.get('files', {})
             
             # === 修复：对生成的文件链接进行 Quote 编码，防止特殊字符（如 %20）导致链接失效 ===
@@ -714,7 +1394,8 @@ def index():
                            shot_preview_link=shot_preview_link,
                            mediainfo_content=mediainfo_content,
                            bbcode_content=bbcode_content, 
-                           error_msg=error_msg)
+                           error_msg=error_msg,
+                           shot_note=shot_note)
 
 @app.route('/download')
 @login_required
@@ -732,6 +1413,22 @@ def download_file():
             
     return "文件未找到"
 
+@app.route('/thumbnail')
+@login_required
+def thumbnail():
+    try: file_path = get_safe_path(request.args.get('path', ''))
+    except ValueError: return "Invalid path", 400
+    if not os.path.isfile(file_path) or not is_thumb_candidate(file_path): return "File not found", 404
+
+    result = request_thumbnail(file_path)
+    if result is not None and not isinstance(result, str):
+        try: result = result.result(timeout=30)
+        except Exception: result = None
+    if not result: return "Thumbnail unavailable", 404
+    response = send_file(result, mimetype='image/jpeg')
+    response.cache_control.max_age = 86400
+    return response
+
 @app.route('/view_image')
 @login_required
 def view_image():
@@ -750,4 +1447,5 @@ def view_image():
 
 if __name__ == '__main__':
     app.config['JSON_AS_ASCII'] = False
+    print(f"🚀 启动耗时: {(time.perf_counter() - BOOT_START) * 1000:.0f} ms", flush=True)
     app.run(host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file